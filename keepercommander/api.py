@@ -139,7 +139,12 @@ def decrypt_rsa_key(encrypted_private_key, data_key):
     }
     """
     decoded_data = utils.base64_url_decode(encrypted_private_key)
-    return RSA.importKey(crypto.decrypt_aes_v1(decoded_data, data_key))
+    return import_rsa_key(crypto.decrypt_aes_v1(decoded_data, data_key))
+
+
+def import_rsa_key(private_key):
+    """ Load an already decrypted PKCS1 formatted RSA private key """
+    return RSA.importKey(private_key)
 
 
 def get_record(params, record_uid):
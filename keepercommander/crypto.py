@@ -9,6 +9,7 @@
 # Contact: ops@keepersecurity.com
 #
 
+import hashlib
 import io
 import secrets
 
@@ -22,11 +23,11 @@ from cryptography.hazmat.primitives.ciphers.algorithms import AES
 from cryptography.hazmat.primitives.ciphers.modes import CBC, GCM
 from cryptography.hazmat.primitives.hashes import Hash, SHA256, SHA512
 from cryptography.hazmat.primitives.hmac import HMAC
-from cryptography.hazmat.primitives.kdf.pbkdf2 import PBKDF2HMAC
 from cryptography.hazmat.primitives.padding import PKCS7
 
 _CRYPTO_BACKEND = default_backend()
 _CURVE = ec.SECP256R1()
+_RSA_PADDING = PKCS1v15()
 
 
 def pad_data(data):    # type: (bytes) -> bytes
@@ -124,11 +125,11 @@ def decrypt_aes_v2(data, key):
 
 
 def encrypt_rsa(data, rsa_key):
-    return rsa_key.encrypt(data, PKCS1v15())
+    return rsa_key.encrypt(data, _RSA_PADDING)
 
 
 def decrypt_rsa(data, rsa_key):
-    return rsa_key.decrypt(data, PKCS1v15())
+    return rsa_key.decrypt(data, _RSA_PADDING)
 
 
 def encrypt_ec(data, ec_public_key):
@@ -150,8 +151,7 @@ def decrypt_ec(data, ec_private_key):
 
 
 def derive_key_v1(password, salt, iterations):
-    kdf = PBKDF2HMAC(algorithm=SHA256(), length=32, salt=salt, iterations=iterations, backend=_CRYPTO_BACKEND)
-    return kdf.derive(password.encode('utf-8'))
+    return hashlib.pbkdf2_hmac('sha256', password.encode('utf-8'), salt, iterations, 32)
 
 
 def derive_keyhash_v1(password, salt, iterations):
@@ -162,8 +162,7 @@ def derive_keyhash_v1(password, salt, iterations):
 
 
 def derive_keyhash_v2(domain, password, salt, iterations):
-    kdf = PBKDF2HMAC(algorithm=SHA512(), length=64, salt=salt, iterations=iterations, backend=_CRYPTO_BACKEND)
-    derived_key = kdf.derive((domain+password).encode('utf-8'))
+    derived_key = hashlib.pbkdf2_hmac('sha512', (domain+password).encode('utf-8'), salt, iterations, 64)
     hf = HMAC(derived_key, SHA256(), backend=_CRYPTO_BACKEND)
     hf.update(domain.encode('utf-8'))
     return hf.finalize()
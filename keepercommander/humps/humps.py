@@ -4,6 +4,7 @@ This module contains all the core logic for humps.
 """
 import re
 import sys
+from functools import lru_cache
 
 try:
     from collections.abc import Mapping
@@ -106,6 +107,12 @@ def decamelize(str_or_iter):
     if s.isupper():
         return str_or_iter
 
+    return _decamelize_str(s)
+
+
+@lru_cache(maxsize=4096)
+def _decamelize_str(s):
+    # Dictionary keys repeat across list elements, so each distinct key is converted once
     return separate_words(_fix_abbrevations(s)).lower()
 
 
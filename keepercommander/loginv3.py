@@ -1,17 +1,18 @@
-import base64
 import getpass
-import json
 import logging
 import os
 import re
-import webbrowser
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from itertools import zip_longest
 from sys import platform as _platform
-from typing import Optional
-from urllib.parse import urlparse, urlencode, urlunparse, parse_qsl
+from typing import List, Optional, Pattern, Tuple, Union
+from urllib.parse import urlparse, urlunparse
 
-import pyperclip
 from cryptography.hazmat.primitives.asymmetric import ec, rsa
-from google.protobuf.json_format import MessageToJson
+from google.protobuf.internal import api_implementation
+from google.protobuf.json_format import MessageToDict
+from google.protobuf.message import Message
 
 from . import api, rest_api, utils, crypto, constants
 from .breachwatch import BreachWatch
@@ -19,11 +20,61 @@ from .config_storage import loader
 from .display import bcolors
 from .error import KeeperApiError
 from .humps import decamelize
-from .params import KeeperParams
+from .params import KeeperParams, RestApiContext
 from .proto import APIRequest_pb2 as proto, AccountSummary_pb2 as proto_as
 from .proto import breachwatch_pb2 as breachwatch_proto
 from .proto import ssocloud_pb2 as ssocloud
 from .proto.enterprise_pb2 import LoginToMcRequest, LoginToMcResponse, DomainPasswordRulesRequest
+from .rest_api import CLIENT_VERSION
+
+try:
+    import orjson
+
+    _json_loads = orjson.loads
+
+    def _json_dumps(obj):    # type: (object) -> str
+        return orjson.dumps(obj).decode('utf-8')
+except ImportError:
+    from json import dumps as _json_dumps, loads as _json_loads
+
+two_factor_channel_descriptions = {
+    proto.TWO_FA_CODE_TOTP: 'TOTP (Google and Microsoft Authenticator)',
+    proto.TWO_FA_CT_SMS: 'Send SMS Code',
+    proto.TWO_FA_CT_DUO: 'DUO',
+    proto.TWO_FA_CT_RSA: 'RSA SecurID',
+    proto.TWO_FA_CT_U2F: 'U2F (FIDO Security Key)',
+    proto.TWO_FA_CT_WEBAUTHN: 'WebAuthN (FIDO2 Security Key)',
+    proto.TWO_FA_CT_DNA: 'Keeper DNA (Watch)',
+}
+
+two_factor_fido_channels = frozenset((proto.TWO_FA_CT_U2F, proto.TWO_FA_CT_WEBAUTHN))
+two_factor_prompt_channels = frozenset((proto.TWO_FA_CT_TOTP, proto.TWO_FA_CT_DUO, proto.TWO_FA_CT_RSA, proto.TWO_FA_CT_DNA))
+two_factor_supported_channels = frozenset((proto.TWO_FA_CODE_TOTP, proto.TWO_FA_CT_SMS, proto.TWO_FA_CT_DUO,
+                                           proto.TWO_FA_CT_RSA, proto.TWO_FA_CT_U2F, proto.TWO_FA_CT_WEBAUTHN,
+                                           proto.TWO_FA_CT_DNA))
+# Channels offered once the FIDO package is known to be missing
+two_factor_non_fido_channels = two_factor_supported_channels - two_factor_fido_channels
+
+# Backreferences, conditional group references and global inline flags in a domain password rule
+password_rule_context_pattern = re.compile(r'\\\d|\(\?P=|\(\?\(|\(\?[aiLmsux]+\)')
+
+two_factor_duration_pattern = re.compile(r'2fa_duration\s*=\s*(.+)', re.IGNORECASE)
+
+two_factor_durations = {
+    'login': proto.TWO_FA_EXP_IMMEDIATELY,
+    '12_hours': proto.TWO_FA_EXP_12_HOURS,
+    '24_hours': proto.TWO_FA_EXP_24_HOURS,
+    '30_days': proto.TWO_FA_EXP_30_DAYS,
+    'forever': proto.TWO_FA_EXP_NEVER,
+}
+
+two_factor_duration_descriptions = {
+    proto.TWO_FA_EXP_IMMEDIATELY: 'Require Every Login',
+    proto.TWO_FA_EXP_12_HOURS: 'Ask Every 12 hours',
+    proto.TWO_FA_EXP_24_HOURS: 'Ask Every 24 hours',
+    proto.TWO_FA_EXP_30_DAYS: 'Ask Every 30 days',
+    proto.TWO_FA_EXP_NEVER: 'Save on this Device Forever',
+}
 
 install_fido_package_warning = 'You can use Security Key with Commander:\n' + \
                                'Install fido2 package ' + bcolors.OKGREEN + \
@@ -34,6 +85,40 @@ permissions_error_msg = "Grant Commander SDK permissions to access Keeper by nav
                         "'Enable' check box next to Commander SDK.\nAlso note that if user has more than two roles " \
                         "assigned then the most restrictive policy from all the roles will be applied."
 
+verify_device_menu = '\n'.join((
+    'Approve by selecting a method below:',
+    f'\t"{bcolors.OKGREEN}email_send{bcolors.ENDC}" to send email',
+    f'\t"{bcolors.OKGREEN}email_code=<code>{bcolors.ENDC}" to validate verification code sent via email',
+    f'\t"{bcolors.OKGREEN}keeper_push{bcolors.ENDC}" to send Keeper Push notification',
+    f'\t"{bcolors.OKGREEN}2fa_send{bcolors.ENDC}" to send 2FA code',
+    f'\t"{bcolors.OKGREEN}2fa_code=<code>{bcolors.ENDC}" to validate a code provided by 2FA application',
+    f'\t"{bcolors.OKGREEN}<Enter>{bcolors.ENDC}" to resume',
+))
+
+# Exact selections accepted by the device approval menu; "email_code=" and "2fa_code=" carry a value
+verify_device_actions = {
+    'email_send': 'email_send',
+    'es': 'email_send',
+    'keeper_push': 'keeper_push',
+    'kp': 'keeper_push',
+    '2fa_send': '2fa_send',
+    '2fs': '2fa_send',
+    '': 'resume',
+}
+
+# Per-thread request messages reused by the 2FA retry loop. Callers Clear() them once the request is sent
+# so the login token and 2FA code are not kept after the call.
+_thread_requests = threading.local()
+
+
+def _reusable_request(message_class):
+    name = message_class.DESCRIPTOR.full_name
+    rq = getattr(_thread_requests, name, None)
+    if rq is None:
+        rq = message_class()
+        setattr(_thread_requests, name, rq)
+    return rq
+
 
 class LoginV3Flow:
     warned_on_fido_package = False
@@ -42,13 +127,11 @@ class LoginV3Flow:
     def login(params, new_device=False, new_login=False):   # type: (KeeperParams, bool, bool) -> None
 
         logging.debug("Login v3 Start as '%s'", params.user)
+        logging.debug('Protobuf implementation: %s', api_implementation.Type())
 
         encryptedDeviceToken = LoginV3API.get_device_id(params, new_device)
 
-        if new_login:
-            clone_code_bytes = None
-        else:
-            clone_code_bytes = utils.base64_url_decode(params.clone_code) if params.clone_code else None
+        clone_code_bytes = None if new_login else params.clone_code_bytes
 
         params.sso_login_info = None
         login_type = 'NORMAL'
@@ -61,8 +144,6 @@ class LoginV3Flow:
 
         while True:
 
-            is_cloud = resp.loginState == proto.REQUIRES_DEVICE_ENCRYPTED_DATA_KEY
-
             if resp.loginState == proto.DEVICE_APPROVAL_REQUIRED:  # client goes to “standard device approval”.
                 print("\nDevice Approval Required")
 
@@ -101,10 +182,9 @@ class LoginV3Flow:
                     while not params.user:
                         params.user = getpass.getpass(prompt='User(Email): ', stream=None)
 
-                encryptedLoginToken = resp.encryptedLoginToken
-                if encryptedLoginToken:
+                if resp.encryptedLoginToken:
                     # Successfully completed 2FA. Re-login
-                    resp = LoginV3API.resume_login(params, encryptedLoginToken, encryptedDeviceToken, clone_code_bytes)
+                    resp = LoginV3API.resume_login(params, resp.encryptedLoginToken, encryptedDeviceToken, clone_code_bytes)
 
                 # raise Exception('Username is required.')
 
@@ -119,14 +199,13 @@ class LoginV3Flow:
                     resp = LoginV3API.startLoginMessage(params, encryptedDeviceToken, loginType='ALTERNATE')
 
             elif resp.loginState == proto.REQUIRES_DEVICE_ENCRYPTED_DATA_KEY:
-                encryptedLoginToken = resp.encryptedLoginToken
                 LoginV3Flow.handleSsoRequestDataKey(params, resp.encryptedLoginToken, encryptedDeviceToken)
-                resp = LoginV3API.resume_login(params, encryptedLoginToken, encryptedDeviceToken)
+                resp = LoginV3API.resume_login(params, resp.encryptedLoginToken, encryptedDeviceToken)
 
             elif resp.loginState == proto.REQUIRES_ACCOUNT_CREATION:
                 # if isSSOAccount:
                 #     return createNewSso
-                raise Exception('This account need to be created.' % rest_api.CLIENT_VERSION)
+                raise Exception('This account need to be created.')
 
             elif resp.loginState == proto.REGION_REDIRECT:
                 params.server = resp.stateSpecificValue
@@ -143,6 +222,8 @@ class LoginV3Flow:
 
                 salt_bytes = salt.salt
                 salt_iterations = salt.iterations
+                params.salt = salt_bytes
+                params.iterations = salt_iterations
 
                 while True:
                     if not params.password and params.sso_login_info:
@@ -153,8 +234,6 @@ class LoginV3Flow:
                     if not params.password:
                         return
 
-                    params.salt = salt_bytes
-                    params.iterations = salt_iterations
                     params.auth_verifier = crypto.derive_keyhash_v1(params.password, salt_bytes, salt_iterations)
 
                     try:
@@ -172,7 +251,7 @@ class LoginV3Flow:
                     return
                 else:
                     # Not successfully authenticated, so restart login process
-                    clone_code_bytes = utils.base64_url_decode(params.clone_code) if params.clone_code else None
+                    clone_code_bytes = params.clone_code_bytes
                     resp = LoginV3API.startLoginMessage(params, encryptedDeviceToken, cloneCode=clone_code_bytes)
 
             elif resp.loginState == proto.DEVICE_ACCOUNT_LOCKED:
@@ -201,15 +280,24 @@ class LoginV3Flow:
         """
         params.user = resp.primaryUsername
         params.account_uid_bytes = resp.accountUid
-        session_token = CommonHelperMethods.bytes_to_url_safe_str(resp.encryptedSessionToken)
-        params.session_token = session_token
-
-        login_type_message = LoginV3Flow.get_data_key(params, resp)
+        params.session_token = utils.base64_url_encode(resp.encryptedSessionToken)
+
+        # These requests require the session token only: issue them while the data key is being derived.
+        # Leaving the executor block waits for both, so no request outlives this function.
+        enterprise_key_future = None
+        with ThreadPoolExecutor(max_workers=2) as executor:
+            acct_summary_future = executor.submit(LoginV3API.accountSummary, params)
+            if resp.sessionTokenType == proto.NO_RESTRICTION:
+                enterprise_key_future = executor.submit(
+                    api.communicate_rest, params, None, 'enterprise/get_enterprise_public_key',
+                    rs_type=breachwatch_proto.EnterprisePublicKeyResponse)
+            login_type_message = LoginV3Flow.get_data_key(params, resp)
         params.password = None
-        params.clone_code = utils.base64_url_encode(resp.cloneCode)
+        params.clone_code_bytes = resp.cloneCode
         loader.store_config_properties(params)
 
-        LoginV3Flow.populateAccountSummary(params)
+        # A failed account summary request is raised only after the password is cleared and the clone code is stored
+        LoginV3Flow.populateAccountSummary(params, acct_summary_future.result())
 
         if resp.sessionTokenType != proto.NO_RESTRICTION:
             # This is not a happy-path login.  Let the user know what's wrong.
@@ -238,9 +326,9 @@ class LoginV3Flow:
                 raise Exception('Please log into the web Vault to update your account settings.')
 
         if params.license and 'account_type' in params.license:
-            if params.license['account_type'] == 2:
+            if params.license['account_type'] == 2 and enterprise_key_future:
                 try:
-                    rs = api.communicate_rest(params, None, 'enterprise/get_enterprise_public_key', rs_type=breachwatch_proto.EnterprisePublicKeyResponse)
+                    rs = enterprise_key_future.result()
                     if rs.enterpriseECCPublicKey:
                         params.enterprise_ec_key = crypto.load_ec_public_key(rs.enterpriseECCPublicKey)
                     if rs.enterprisePublicKey:
@@ -265,7 +353,7 @@ class LoginV3Flow:
         Returns login_type_message which is one of ("Persistent Login", "Password", "Master Password").
         """
         if resp.encryptedDataKeyType == proto.BY_DEVICE_PUBLIC_KEY:
-            private_key = crypto.load_ec_private_key(utils.base64_url_decode(params.device_private_key))
+            private_key = LoginV3API.get_device_private_key(params)
             decrypted_data_key = crypto.decrypt_ec(resp.encryptedDataKey, private_key)
             if params.sso_login_info:
                 login_type_message = bcolors.UNDERLINE + "SSO Login"
@@ -302,6 +390,10 @@ class LoginV3Flow:
         rules_rq.username = params.user
         rules_rs = api.communicate_rest(params, rules_rq, 'authentication/get_domain_password_rules',
                                         rs_type=proto.NewUserMinimumParams)
+        # A rule without a description is still enforced and reported by its regex
+        rules = [(re.compile(rule), description or rule) for rule, description
+                 in zip_longest(rules_rs.passwordMatchRegex, rules_rs.passwordMatchDescription) if rule is not None]
+        all_rules = LoginV3Flow.combine_password_rules([pattern for pattern, _ in rules])
         try:
             print('Your Master Password has expired, you are required to change it before you can login.')
             print('')
@@ -315,12 +407,10 @@ class LoginV3Flow:
                                             stream=None).strip()
 
                 if password == password2:
-                    failed_rules = []
-                    for i in range(len(rules_rs.passwordMatchRegex)):
-                        rule = rules_rs.passwordMatchRegex[i]
-                        pattern = re.compile(rule)
-                        if not re.match(pattern, password):
-                            failed_rules.append(rules_rs.passwordMatchDescription[i])
+                    if all_rules and all_rules.match(password):
+                        failed_rules = []
+                    else:
+                        failed_rules = [description for pattern, description in rules if not pattern.match(password)]
                     if len(failed_rules) == 0:
                         LoginV3API.change_master_password(params, password)
                         logging.info('Password changed')
@@ -336,9 +426,27 @@ class LoginV3Flow:
         return False
 
     @staticmethod
-    def populateAccountSummary(params: KeeperParams):
+    def combine_password_rules(patterns):    # type: (List[Pattern]) -> Optional[Pattern]
+        """Combine compiled password rules into a single pattern that matches only if every rule matches
+
+        Every rule is matched at the start of the password, so a chain of lookaheads checks them all at once.
+        Returns None if the rules cannot be combined safely.
+        """
+        if not patterns:
+            return None
+        # Group references and global inline flags change meaning when the rules are concatenated
+        if any(password_rule_context_pattern.search(x.pattern) for x in patterns):
+            return None
+        try:
+            return re.compile(''.join(f'(?={x.pattern})' for x in patterns))
+        except re.error:
+            return None
+
+    @staticmethod
+    def populateAccountSummary(params: KeeperParams, acct_summary: Optional[proto_as.AccountSummaryElements] = None):
 
-        acct_summary = LoginV3API.accountSummary(params)
+        if acct_summary is None:
+            acct_summary = LoginV3API.accountSummary(params)
 
         if acct_summary.clientKey:
             try:
@@ -346,30 +454,18 @@ class LoginV3Flow:
             except Exception as e:
                 logging.debug('Decrypt client key error: %s', e)
 
-        # Loading summary as dictionary for backwards compatibility
-        acct_summary_json = MessageToJson(acct_summary, preserving_proto_field_name=False)
-        acct_summary_dict = json.loads(acct_summary_json)
-        acct_summary_dict_snake_case = decamelize(acct_summary_dict)
-
-        if 'keys_info' in acct_summary_dict_snake_case:
-            keys = acct_summary_dict_snake_case['keys_info']
-            if 'encrypted_private_key' in keys:
-                params.rsa_key = api.decrypt_rsa_key(keys['encrypted_private_key'], params.data_key)
-                encrypted_private_key = utils.base64_url_decode(keys['encrypted_private_key'])
-                decrypted_private_key = crypto.decrypt_aes_v1(encrypted_private_key, params.data_key)
-                params.rsa_key2 = crypto.load_rsa_private_key(decrypted_private_key)
-            if 'encrypted_ecc_private_key' in keys:
-                encrypted_ecc_key = utils.base64_url_decode(keys['encrypted_ecc_private_key'])
-                decrypted_ecc_key = crypto.decrypt_aes_v2(encrypted_ecc_key, params.data_key)
-                params.ecc_key = crypto.load_ec_private_key(decrypted_ecc_key)
-
-        if not params.session_token:
-            if 'session_token' in acct_summary_dict_snake_case:
-                params.session_token = acct_summary_dict_snake_case['session_token']
-
-        # enforcements
-        if 'enforcements' in acct_summary_dict_snake_case:
-            params.enforcements = acct_summary_dict_snake_case['enforcements']
+        keys = acct_summary.keysInfo
+        if keys.encryptedPrivateKey:
+            decrypted_private_key = crypto.decrypt_aes_v1(keys.encryptedPrivateKey, params.data_key)
+            params.rsa_key = api.import_rsa_key(decrypted_private_key)
+            params.rsa_key2 = crypto.load_rsa_private_key(decrypted_private_key)
+        if keys.encryptedEccPrivateKey:
+            decrypted_ecc_key = crypto.decrypt_aes_v2(keys.encryptedEccPrivateKey, params.data_key)
+            params.ecc_key = crypto.load_ec_private_key(decrypted_ecc_key)
+
+        # enforcements, settings and license are loaded as dictionaries for backwards compatibility
+        if acct_summary.HasField('Enforcements'):
+            params.enforcements = LoginV3Flow.summary_section_to_dict(acct_summary.Enforcements)
             if params.enforcements:
                 if 'logout_timer_desktop' in params.enforcements:
                     logout_timer = params.enforcements['logout_timer_desktop']
@@ -377,58 +473,52 @@ class LoginV3Flow:
                         if params.logout_timer == 0 or logout_timer < params.logout_timer:
                             params.logout_timer = logout_timer
 
-        # settings
-        params.settings = acct_summary_dict_snake_case['settings']
-
-        # keys
-        # if acct_summary.clientKey:
-        #     clientKey = acct_summary.clientKey
-
-        # if acct_summary.keysInfo:
-        #     if acct_summary.keysInfo.encryptedPrivateKey:
-        #         print("ddd")
-
-        # license
-        params.license = acct_summary_dict_snake_case['license']
+        params.settings = LoginV3Flow.summary_section_to_dict(acct_summary.settings)
+        params.license = LoginV3Flow.summary_section_to_dict(acct_summary.license)
 
-        if acct_summary_dict_snake_case.get('is_enterprise_admin'):
+        if acct_summary.isEnterpriseAdmin:
             api.query_enterprise(params)
 
         params.sync_data = True
         params.prepare_commands = True
 
     @staticmethod
-    def verifyDevice(params: KeeperParams, encryptedDeviceToken: bytes, encryptedLoginToken: bytes):
+    def summary_section_to_dict(message):
+        return decamelize(MessageToDict(message, preserving_proto_field_name=False))
 
-        print("Approve by selecting a method below:")
+    @staticmethod
+    def verifyDevice(params: KeeperParams, encryptedDeviceToken: bytes, encryptedLoginToken: bytes):
 
-        print("\t\"" + bcolors.OKGREEN + "email_send" + bcolors.ENDC + "\" to send email")
-        print("\t\"" + bcolors.OKGREEN + "email_code=<code>" + bcolors.ENDC + "\" to validate verification code sent via email")
-        print("\t\"" + bcolors.OKGREEN + "keeper_push" + bcolors.ENDC + "\" to send Keeper Push notification")
-        print("\t\"" + bcolors.OKGREEN + "2fa_send" + bcolors.ENDC + "\" to send 2FA code")
-        print("\t\"" + bcolors.OKGREEN + "2fa_code=<code>" + bcolors.ENDC + "\" to validate a code provided by 2FA application")
-        print("\t\"" + bcolors.OKGREEN + "<Enter>" + bcolors.ENDC + "\" to resume")
+        print(verify_device_menu)
 
         selection = input('Type your selection or <Enter> to resume: ')
 
-        if selection == "email_send" or selection == "es":
+        action = verify_device_actions.get(selection)
+        code = ''
+        if action is None:
+            if selection.startswith("email_code="):
+                action = 'email_code'
+                code = selection[len("email_code="):]
+            elif selection.startswith("2fa_code="):
+                action = '2fa_code'
+                code = selection[len("2fa_code="):]
+
+        if action == 'email_send':
 
             rs = LoginV3API.requestDeviceVerificationMessage(params, encryptedDeviceToken, 'email')
 
-            if type(rs) == bytes:
+            if isinstance(rs, bytes):
                 print(bcolors.WARNING + "\nAn email with instructions has been sent to " + params.user + bcolors.WARNING + '\nPress <Enter> when approved.')
             else:
                 raise KeeperApiError(rs['error'], rs['message'])
 
-        elif selection.startswith("email_code="):
-            code = selection.replace("email_code=", "")
-
+        elif action == 'email_code':
             rs = LoginV3API.validateDeviceVerificationCodeMessage(
                 params,
                 code
             )
 
-            if type(rs) == bytes:
+            if isinstance(rs, bytes):
 
                 print("Successfully verified email code.")
                 return True
@@ -436,39 +526,37 @@ class LoginV3Flow:
                 print()
                 print(bcolors.WARNING + rs['message'] + bcolors.ENDC)
 
-        elif selection == "2fa_send" or selection == "2fs":
+        elif action == '2fa_send':
             rs = LoginV3API.twoFactorSend2FAPushMessage(
                 params,
                 encryptedLoginToken)
-            if type(rs) == bytes:
+            if isinstance(rs, bytes):
                 print(bcolors.WARNING + "\n2FA code was sent." + bcolors.ENDC)
             else:
                 raise KeeperApiError(rs['error'], rs['message'])
 
-        elif selection.startswith("2fa_code="):
-            code = selection.replace("2fa_code=", "")
-
+        elif action == '2fa_code':
             rs = LoginV3API.twoFactorValidateMessage(params, encryptedLoginToken, code, proto.TWO_FA_EXP_IMMEDIATELY)
 
-            if type(rs) == bytes:
+            if isinstance(rs, bytes):
                 logging.info("Successfully verified 2FA code.")
                 return True
             else:
                 raise KeeperApiError(rs['error'], rs['message'])
 
-        elif selection == "keeper_push" or selection == "kp":
+        elif action == 'keeper_push':
 
             rs = LoginV3API.twoFactorSend2FAPushMessage(
                 params,
                 encryptedLoginToken,
                 pushType=proto.TWO_FA_PUSH_KEEPER)
 
-            if type(rs) == bytes:
+            if isinstance(rs, bytes):
                 logging.info('Successfully made a push notification to the approved device.\nPress <Enter> when approved.')
             else:
                 raise KeeperApiError(rs['error'], rs['message'])
 
-        elif selection == "":
+        elif action == 'resume':
             return True
 
     @staticmethod
@@ -496,7 +584,7 @@ class LoginV3Flow:
                 elif answer == '2':
                     rq = proto.DeviceVerificationRequest()
                     rq.username = params.user
-                    rq.clientVersion = rest_api.CLIENT_VERSION
+                    rq.clientVersion = CLIENT_VERSION
                     rq.encryptedDeviceToken = device_token
 
                     rs = api.communicate_rest(params, rq, "authentication/request_device_admin_approval", rs_type=proto.DeviceVerificationResponse)
@@ -507,50 +595,30 @@ class LoginV3Flow:
             except Exception as e:
                 logging.warning(f'Device approval request failed: {e}')
 
+    @staticmethod
+    def sso_login_url(sso_url, sp_params):    # type: (str, str) -> str
+        # URL-safe base64 needs no escaping, so the parameters are appended to the existing query as is
+        sp_url_builder = urlparse(sso_url)
+        sp_url_query = f'{sp_url_builder.query}&{sp_params}' if sp_url_builder.query else sp_params
+        return urlunparse(sp_url_builder._replace(query=sp_url_query))
+
     @staticmethod
     def handleSsoRedirect(params, is_cloud, sso_url, login_token):
         # type: (KeeperParams, bool, str, bytes) -> Optional[bytes]
-        sp_url_builder = urlparse(sso_url)
-        sp_url_query = parse_qsl(sp_url_builder.query, keep_blank_values=True)
         if is_cloud:
-            sso_rq = ssocloud.SsoCloudRequest()
-            sso_rq.clientVersion = rest_api.CLIENT_VERSION
-            sso_rq.dest = 'commander'
-            sso_rq.username = params.user.lower()
-            sso_rq.forceLogin = False
-            sso_rq.detached = True
-
-            transmission_key = utils.generate_aes_key()
-            rq_payload = proto.ApiRequestPayload()
-            rq_payload.apiVersion = 3
-            rq_payload.payload = sso_rq.SerializeToString()
-            api_rq = proto.ApiRequest()
-            api_rq.locale = params.rest_context.locale or 'en_US'
-
-            server_public_key = rest_api.SERVER_PUBLIC_KEYS[params.rest_context.server_key_id]
-            if isinstance(server_public_key, rsa.RSAPublicKey):
-                api_rq.encryptedTransmissionKey = crypto.encrypt_rsa(transmission_key, server_public_key)
-            elif isinstance(server_public_key, ec.EllipticCurvePublicKey):
-                api_rq.encryptedTransmissionKey = crypto.encrypt_ec(transmission_key, server_public_key)
-            else:
-                raise ValueError('Invalid server public key')
-            api_rq.publicKeyId = params.rest_context.server_key_id
-            api_rq.encryptedPayload = crypto.encrypt_aes_v2(rq_payload.SerializeToString(), transmission_key)
-
-            sp_url_query.append(('payload', utils.base64_url_encode(api_rq.SerializeToString())))
+            sso_payload, transmission_key = LoginV3API.sso_cloud_payload(params)
+            sp_params = 'payload=' + utils.base64_url_encode(sso_payload)
         else:
             rsa_private, rsa_public = crypto.generate_rsa_key()
             rsa_public_bytes = crypto.unload_rsa_public_key(rsa_public)
-            sp_url_query.append(('key', utils.base64_url_encode(rsa_public_bytes)))
-            sp_url_query.append(('dest', 'commander'))
-            sp_url_query.append(('embedded', ''))
+            sp_params = f'key={utils.base64_url_encode(rsa_public_bytes)}&dest=commander&embedded='
 
         try:
+            import webbrowser
             wb = webbrowser.get()
         except:
             wb = None
-        sp_url_builder = sp_url_builder._replace(query=urlencode(sp_url_query, doseq=True))
-        sp_url = urlunparse(sp_url_builder)
+        sp_url = LoginV3Flow.sso_login_url(sso_url, sp_params)
         print(f'\nSSO Login URL:\n{sp_url}')
         print('Navigate to SSO Login URL with your browser and complete login.')
         print('Copy a returned SSO Token into clipboard.')
@@ -573,6 +641,7 @@ class LoginV3Flow:
             if token == 'c':
                 token = None
                 try:
+                    import pyperclip
                     pyperclip.copy(sp_url)
                     print('SSO Login URL is copied to clipboard.')
                 except:
@@ -586,6 +655,7 @@ class LoginV3Flow:
                         print('Failed to open web browser.')
             elif token == 'p':
                 try:
+                    import pyperclip
                     token = pyperclip.paste()
                 except:
                     token = ''
@@ -609,28 +679,28 @@ class LoginV3Flow:
                         }
                         return sso_rs.encryptedLoginToken
                     else:
-                        sso_dict = json.loads(token)
+                        sso_dict = _json_loads(token)
                         if 'email' in sso_dict:
                             params.user = sso_dict['email']
 
+                        sso_passwords = []
+                        for field in ('password', 'new_password'):
+                            encrypted_password = sso_dict.get(field)
+                            if encrypted_password:
+                                pswd = crypto.decrypt_rsa(utils.base64_url_decode(encrypted_password), rsa_private)
+                                sso_passwords.append(pswd.decode('utf-8'))
+
                         params.sso_login_info = {
                             'is_cloud': is_cloud,
                             'sso_provider': sso_dict.get('provider_name') or '',
                             'idp_session_id': sso_dict.get('session_id') or '',
                             'sso_url': sso_url,
-                            'sso_password': []
+                            'sso_password': sso_passwords
                         }
-                        if 'password' in sso_dict:
-                            pswd = utils.base64_url_decode(sso_dict['password'])
-                            pswd = crypto.decrypt_rsa(pswd, rsa_private)
-                            params.sso_login_info['sso_password'].append(pswd.decode('utf-8'))
-                        if 'new_password' in sso_dict:
-                            pswd = utils.base64_url_decode(sso_dict['new_password'])
-                            pswd = crypto.decrypt_rsa(pswd, rsa_private)
-                            params.sso_login_info['sso_password'].append(pswd.decode('utf-8'))
-
-                        if sso_dict.get('login_token'):
-                            return utils.base64_url_decode(sso_dict.get('login_token'))
+
+                        sso_login_token = sso_dict.get('login_token')
+                        if sso_login_token:
+                            return utils.base64_url_decode(sso_login_token)
                         else:
                             return login_token
                 except Exception as e:
@@ -638,32 +708,16 @@ class LoginV3Flow:
 
     @staticmethod
     def two_factor_channel_to_desc(channel):
-        if channel == proto.TWO_FA_CODE_TOTP:
-            return 'TOTP (Google and Microsoft Authenticator)'
-        if channel == proto.TWO_FA_CT_SMS:
-            return 'Send SMS Code'
-        if channel == proto.TWO_FA_CT_DUO:
-            return 'DUO'
-        if channel == proto.TWO_FA_CT_RSA:
-            return 'RSA SecurID'
-        if channel == proto.TWO_FA_CT_U2F:
-            return 'U2F (FIDO Security Key)'
-        if channel == proto.TWO_FA_CT_WEBAUTHN:
-            return 'WebAuthN (FIDO2 Security Key)'
-        if channel == proto.TWO_FA_CT_DNA:
-            return 'Keeper DNA (Watch)'
+        return two_factor_channel_descriptions.get(channel, '')
 
     @staticmethod
     def handleTwoFactor(params: KeeperParams, encryptedLoginToken, login_resp):
         print("This account requires 2FA Authentication")
 
-        supported_channels = {proto.TWO_FA_CODE_TOTP, proto.TWO_FA_CT_SMS, proto.TWO_FA_CT_DUO, proto.TWO_FA_CT_RSA,
-                              proto.TWO_FA_CT_U2F, proto.TWO_FA_CT_WEBAUTHN, proto.TWO_FA_CT_DNA}
+        supported_channels = two_factor_non_fido_channels if LoginV3Flow.warned_on_fido_package \
+            else two_factor_supported_channels
         channels = [x for x in login_resp.channels if x.channelType in supported_channels]
 
-        if LoginV3Flow.warned_on_fido_package:
-            channels = [x for x in channels if x.channelType not in {proto.TWO_FA_CT_U2F, proto.TWO_FA_CT_WEBAUTHN}]
-
         for i in range(len(channels)):
             channel = channels[i]
             print(f"{i+1:>3}. {LoginV3Flow.two_factor_channel_to_desc(channel.channelType)} {channel.channelName} {channel.phoneNumber}")
@@ -673,7 +727,7 @@ class LoginV3Flow:
             selection = input('Selection: ')
             if selection == 'q':
                 raise KeyboardInterrupt()
-            assert selection.isnumeric()
+            assert selection.isdecimal()
             idx = 1 if not selection else int(selection)
             assert 1 <= idx <= len(channels)
             channel = channels[idx-1]
@@ -698,17 +752,17 @@ class LoginV3Flow:
                 expireIn=proto.TWO_FA_EXP_IMMEDIATELY
             )
 
-            if type(rs) == bytes:
+            if isinstance(rs, bytes):
                 logging.info(bcolors.OKGREEN + "\nSuccessfully sent SMS.\n" + bcolors.ENDC)
                 mfa_prompt = True
             else:
                 logging.error("Was unable to send SMS.")
                 raise KeeperApiError(rs['error'], rs['message'])
 
-        elif channel.channelType in {proto.TWO_FA_CT_U2F, proto.TWO_FA_CT_WEBAUTHN}:
+        elif channel.channelType in two_factor_fido_channels:
             try:
                 from .yubikey import yubikey_authenticate
-                challenge = json.loads(channel.challenge)
+                challenge = _json_loads(channel.challenge)
                 response = yubikey_authenticate(challenge)
 
                 if response:
@@ -729,11 +783,11 @@ class LoginV3Flow:
                         }
                         key_value_type = proto.TWO_FA_RESP_WEBAUTHN
 
-                    rs = LoginV3API.twoFactorValidateMessage(params, encryptedLoginToken, json.dumps(signature),
+                    rs = LoginV3API.twoFactorValidateMessage(params, encryptedLoginToken, _json_dumps(signature),
                                                              proto.TWO_FA_EXP_IMMEDIATELY, key_value_type,
                                                              channel_uid=channel.channel_uid)
 
-                    if type(rs) == bytes:
+                    if isinstance(rs, bytes):
 
                         print(bcolors.OKGREEN + "Verified 2FA Code." + bcolors.ENDC)
 
@@ -753,32 +807,22 @@ class LoginV3Flow:
             except Exception as e:
                 logging.error(e)
 
-        elif channel.channelType in {proto.TWO_FA_CT_TOTP, proto.TWO_FA_CT_DUO, proto.TWO_FA_CT_RSA, proto.TWO_FA_CT_DNA}:
+        elif channel.channelType in two_factor_prompt_channels:
             mfa_prompt = True
         else:
             raise NotImplementedError("Unhandled channel type %s" % channel.channelType)
 
         if mfa_prompt:
             config_expiration = params.config.get('mfa_duration') or 'login'
-            mfa_expiration = \
-                proto.TWO_FA_EXP_IMMEDIATELY if config_expiration == 'login' else \
-                    proto.TWO_FA_EXP_NEVER if config_expiration == 'forever' else \
-                        proto.TWO_FA_EXP_12_HOURS if config_expiration == '12_hours' else \
-                            proto.TWO_FA_EXP_24_HOURS if config_expiration == '24_hours' else \
-                                proto.TWO_FA_EXP_30_DAYS
+            mfa_expiration = two_factor_durations.get(config_expiration, proto.TWO_FA_EXP_30_DAYS)
 
             otp_code = ''
             show_duration = True
-            mfa_pattern = re.compile(r'2fa_duration\s*=\s*(.+)', re.IGNORECASE)
             while not otp_code:
                 if show_duration:
                     show_duration = False
                     prompt_exp = '\n2FA Code Duration: {0}.\nTo change duration: 2fa_duration=login|12_hours|24_hours|30_days|forever' \
-                        .format('Require Every Login' if mfa_expiration == proto.TWO_FA_EXP_IMMEDIATELY else
-                                'Save on this Device Forever' if mfa_expiration == proto.TWO_FA_EXP_NEVER else
-                                'Ask Every 12 hours' if mfa_expiration == proto.TWO_FA_EXP_12_HOURS else
-                                'Ask Every 24 hours' if mfa_expiration == proto.TWO_FA_EXP_24_HOURS else
-                                'Ask Every 30 days')
+                        .format(two_factor_duration_descriptions.get(mfa_expiration, 'Ask Every 30 days'))
                     print(prompt_exp)
 
                 try:
@@ -786,30 +830,20 @@ class LoginV3Flow:
                 except KeyboardInterrupt:
                     return
 
-                m_duration = re.match(mfa_pattern, answer)
+                m_duration = two_factor_duration_pattern.match(answer) \
+                    if answer.lower().startswith('2fa_duration') else None
                 if m_duration:
                     answer = m_duration.group(1).strip().lower()
-                    if answer not in ['login', '12_hours', '24_hours', '30_days', 'forever']:
+                    if answer not in two_factor_durations:
                         print(f'Invalid 2FA Duration: {answer}')
                         answer = ''
 
-                if answer == 'login':
-                    show_duration = True
-                    mfa_expiration = proto.TWO_FA_EXP_IMMEDIATELY
-                elif answer == '12_hours':
-                    show_duration = True
-                    mfa_expiration = proto.TWO_FA_EXP_12_HOURS
-                elif answer == '24_hours':
-                    show_duration = True
-                    mfa_expiration = proto.TWO_FA_EXP_24_HOURS
-                elif answer == '30_days':
-                    show_duration = True
-                    mfa_expiration = proto.TWO_FA_EXP_30_DAYS
-                elif answer == 'forever':
-                    show_duration = True
-                    mfa_expiration = proto.TWO_FA_EXP_NEVER
-                else:
+                duration = two_factor_durations.get(answer)
+                if duration is None:
                     otp_code = answer
+                else:
+                    show_duration = True
+                    mfa_expiration = duration
 
             rs = LoginV3API.twoFactorValidateMessage(
                 params,
@@ -819,7 +853,7 @@ class LoginV3Flow:
                 channel_uid=channel.channel_uid
             )
 
-            if type(rs) == bytes:
+            if isinstance(rs, bytes):
 
                 logging.info(bcolors.OKGREEN + "Successfully verified 2FA Code." + bcolors.ENDC)
 
@@ -835,13 +869,16 @@ class LoginV3Flow:
 class LoginV3API:
 
     @staticmethod
-    def rest_request(params: KeeperParams, api_endpoint: str, rq):
-        api_request_payload = proto.ApiRequestPayload()
-        api_request_payload.payload = rq.SerializeToString()
+    def _send(rest_context, api_endpoint, rq, encrypted_session_token=None):
+        # type: (RestApiContext, str, Message, Optional[bytes]) -> Union[bytes, dict]
+        api_request_payload = proto.ApiRequestPayload(payload=rq.SerializeToString())
+        if encrypted_session_token:
+            api_request_payload.encryptedSessionToken = encrypted_session_token
+        return rest_api.execute_rest(rest_context, api_endpoint, api_request_payload)
 
-        rs = rest_api.execute_rest(params.rest_context, api_endpoint, api_request_payload)
-
-        return rs
+    @staticmethod
+    def rest_request(params: KeeperParams, api_endpoint: str, rq):
+        return LoginV3API._send(params.rest_context, api_endpoint, rq)
 
     @staticmethod
     def get_device_id(params, new_device=False):   # type: (KeeperParams, bool) -> bytes
@@ -852,6 +889,7 @@ class LoginV3API:
                 del params.config['device_token']
             if params.device_private_key:
                 params.device_private_key = None
+            params.device_private_key_cache = None
             if 'private_key' in params.config:
                 del params.config['private_key']
 
@@ -859,16 +897,13 @@ class LoginV3API:
             private, public = crypto.generate_ec_key()
 
             rq = proto.DeviceRegistrationRequest()
-            rq.clientVersion = rest_api.CLIENT_VERSION
+            rq.clientVersion = CLIENT_VERSION
             rq.deviceName = CommonHelperMethods.get_device_name()
             rq.devicePublicKey = crypto.unload_ec_public_key(public)
 
-            api_request_payload = proto.ApiRequestPayload()
-            api_request_payload.payload = rq.SerializeToString()
-
-            rs = rest_api.execute_rest(params.rest_context, 'authentication/register_device', api_request_payload)
+            rs = LoginV3API.rest_request(params, 'authentication/register_device', rq)
 
-            if type(rs) == bytes:
+            if isinstance(rs, bytes):
                 register_device_rs = proto.Device()
                 register_device_rs.ParseFromString(rs)
 
@@ -881,6 +916,15 @@ class LoginV3API:
 
         return utils.base64_url_decode(params.device_token)
 
+    @staticmethod
+    def get_device_private_key(params):    # type: (KeeperParams) -> ec.EllipticCurvePrivateKey
+        cached = params.device_private_key_cache
+        if cached and cached[0] == params.device_private_key:
+            return cached[1]
+        device_key = crypto.load_ec_private_key(utils.base64_url_decode(params.device_private_key))
+        params.device_private_key_cache = (params.device_private_key, device_key)
+        return device_key
+
     @staticmethod
     def requestDeviceVerificationMessage(params: KeeperParams,
                                          encrypted_device_token: bytes,
@@ -891,13 +935,10 @@ class LoginV3API:
         rq.username = params.user.lower()
         rq.encryptedDeviceToken = encrypted_device_token
         rq.verificationChannel = verification_channel
-        rq.clientVersion = rest_api.CLIENT_VERSION
+        rq.clientVersion = CLIENT_VERSION
         rq.messageSessionUid = CommonHelperMethods.url_safe_str_to_bytes(message_session_uid or "")
 
-        api_request_payload = proto.ApiRequestPayload()
-        api_request_payload.payload = rq.SerializeToString()
-
-        return rest_api.execute_rest(params.rest_context, 'authentication/request_device_verification', api_request_payload)
+        return LoginV3API.rest_request(params, 'authentication/request_device_verification', rq)
 
     @staticmethod
     def validateDeviceVerificationCodeMessage(params: KeeperParams, verificationCode: str, message_session_uid=None):
@@ -905,20 +946,17 @@ class LoginV3API:
         rq = proto.ValidateDeviceVerificationCodeRequest()
 
         rq.username = params.user.lower()
-        rq.clientVersion = rest_api.CLIENT_VERSION
+        rq.clientVersion = CLIENT_VERSION
         # rq.encryptedDeviceToken = encrypted_device_token
         rq.verificationCode = verificationCode
         rq.messageSessionUid = CommonHelperMethods.url_safe_str_to_bytes(message_session_uid or "")
 
-        api_request_payload = proto.ApiRequestPayload()
-        api_request_payload.payload = rq.SerializeToString()
-
-        return rest_api.execute_rest(params.rest_context, 'authentication/validate_device_verification_code', api_request_payload)
+        return LoginV3API.rest_request(params, 'authentication/validate_device_verification_code', rq)
 
     @staticmethod
     def resume_login(params: KeeperParams, encryptedLoginToken, encryptedDeviceToken, cloneCode = None, loginType = 'NORMAL', loginMethod='EXISTING_ACCOUNT'):
         rq = proto.StartLoginRequest()
-        rq.clientVersion = rest_api.CLIENT_VERSION
+        rq.clientVersion = CLIENT_VERSION
         rq.encryptedLoginToken = encryptedLoginToken
         rq.encryptedDeviceToken = encryptedDeviceToken
         rq.username = params.user.lower()
@@ -927,17 +965,14 @@ class LoginV3API:
             rq.loginMethod = proto.LoginMethod.Value(loginMethod)
             rq.cloneCode = cloneCode
 
-        api_request_payload = proto.ApiRequestPayload()
-        api_request_payload.payload = rq.SerializeToString()
-
-        rs = rest_api.execute_rest(params.rest_context, 'authentication/start_login', api_request_payload)
+        rs = LoginV3API.rest_request(params, 'authentication/start_login', rq)
 
-        if type(rs) == bytes:
+        if isinstance(rs, bytes):
             login_resp = proto.LoginResponse()
             login_resp.ParseFromString(rs)
             return login_resp
 
-        elif type(rs) is dict:
+        elif isinstance(rs, dict):
             if 'error' in rs and 'message' in rs:
                 if rs['error'] == 'region_redirect':
                     params.server = rs['region_host']
@@ -955,7 +990,7 @@ class LoginV3API:
     def startLoginMessage(params, encryptedDeviceToken, cloneCode = None, loginType = 'NORMAL'):
         # type: (KeeperParams, bytes, Optional[bytes], str) -> proto.LoginResponse
         rq = proto.StartLoginRequest()
-        rq.clientVersion = rest_api.CLIENT_VERSION
+        rq.clientVersion = CLIENT_VERSION
         rq.username = params.user.lower()
         rq.encryptedDeviceToken = encryptedDeviceToken
         rq.loginType = proto.LoginType.Value(loginType)
@@ -965,12 +1000,9 @@ class LoginV3API:
             rq.cloneCode = cloneCode
             rq.username = ''
 
-        api_request_payload = proto.ApiRequestPayload()
-        api_request_payload.payload = rq.SerializeToString()
+        rs = LoginV3API.rest_request(params, 'authentication/start_login', rq)
 
-        rs = rest_api.execute_rest(params.rest_context, 'authentication/start_login', api_request_payload)
-
-        if type(rs) == bytes:
+        if isinstance(rs, bytes):
             login_resp = proto.LoginResponse()
             login_resp.ParseFromString(rs)
 
@@ -979,7 +1011,7 @@ class LoginV3API:
 
             return login_resp
 
-        elif type(rs) is dict:
+        elif isinstance(rs, dict):
             if 'error' in rs and 'message' in rs:
                 if rs['error'] == 'region_redirect':
                     params.server = rs['region_host']
@@ -1013,12 +1045,9 @@ class LoginV3API:
         rq.authResponse = params.auth_verifier
         rq.encryptedLoginToken = encrypted_login_token_bytes
 
-        api_request_payload = proto.ApiRequestPayload()
-        api_request_payload.payload = rq.SerializeToString()
-
-        rs = rest_api.execute_rest(params.rest_context, 'authentication/validate_auth_hash', api_request_payload)
+        rs = LoginV3API.rest_request(params, 'authentication/validate_auth_hash', rq)
 
-        if type(rs) == bytes:
+        if isinstance(rs, bytes):
             login_resp = proto.LoginResponse()
             login_resp.ParseFromString(rs)
             return login_resp
@@ -1027,26 +1056,58 @@ class LoginV3API:
             raise KeeperApiError(error_code, 'Invalid email or password combination, please re-enter.' if error_code == 'auth_failed' else rs['message'] )
 
     @staticmethod
-    def twoFactorValidateMessage(params, encryptedLoginToken, otp_code, tfa_expire_in,
-                                 twoFactorValueType=None, channel_uid=None):
+    def sso_cloud_payload(params):    # type: (KeeperParams) -> Tuple[bytes, bytes]
+        """Build the encrypted request passed to the cloud SSO login page
 
-        rq = proto.TwoFactorValidateRequest()
-        rq.encryptedLoginToken = encryptedLoginToken
-        rq.value = otp_code
+        Returns the serialized ApiRequest and the transmission key needed to decrypt the SSO token.
+        """
+        sso_rq = ssocloud.SsoCloudRequest()
+        sso_rq.clientVersion = CLIENT_VERSION
+        sso_rq.dest = 'commander'
+        sso_rq.username = params.user.lower()
+        sso_rq.forceLogin = False
+        sso_rq.detached = True
+
+        transmission_key = utils.generate_aes_key()
+        rq_payload = proto.ApiRequestPayload()
+        rq_payload.apiVersion = 3
+        rq_payload.payload = sso_rq.SerializeToString()
+
+        rest_context = params.rest_context
+        server_key_id = rest_context.server_key_id
+        server_public_key = rest_api.SERVER_PUBLIC_KEYS[server_key_id]
+        api_rq = proto.ApiRequest()
+        api_rq.locale = rest_context.locale or 'en_US'
+        if isinstance(server_public_key, rsa.RSAPublicKey):
+            api_rq.encryptedTransmissionKey = crypto.encrypt_rsa(transmission_key, server_public_key)
+        elif isinstance(server_public_key, ec.EllipticCurvePublicKey):
+            api_rq.encryptedTransmissionKey = crypto.encrypt_ec(transmission_key, server_public_key)
+        else:
+            raise ValueError('Invalid server public key')
+        api_rq.publicKeyId = server_key_id
+        api_rq.encryptedPayload = crypto.encrypt_aes_v2(rq_payload.SerializeToString(), transmission_key)
 
-        if twoFactorValueType:
-            rq.valueType = twoFactorValueType
-        if channel_uid:
-            rq.channel_uid = channel_uid
+        return api_rq.SerializeToString(), transmission_key
 
-        rq.expireIn = tfa_expire_in
+    @staticmethod
+    def twoFactorValidateMessage(params, encryptedLoginToken, otp_code, tfa_expire_in,
+                                 twoFactorValueType=None, channel_uid=None):
+
+        rq = _reusable_request(proto.TwoFactorValidateRequest)
+        try:
+            rq.encryptedLoginToken = encryptedLoginToken
+            rq.value = otp_code
 
-        api_request_payload = proto.ApiRequestPayload()
-        api_request_payload.payload = rq.SerializeToString()
+            if twoFactorValueType:
+                rq.valueType = twoFactorValueType
+            if channel_uid:
+                rq.channel_uid = channel_uid
 
-        rs = rest_api.execute_rest(params.rest_context, 'authentication/2fa_validate', api_request_payload)
+            rq.expireIn = tfa_expire_in
 
-        return rs
+            return LoginV3API.rest_request(params, 'authentication/2fa_validate', rq)
+        finally:
+            rq.Clear()
 
     @staticmethod
     def twoFactorSend2FAPushMessage(params: KeeperParams,
@@ -1055,28 +1116,27 @@ class LoginV3API:
                                     channel_uid=None,
                                     expireIn=None):
 
-        rq = proto.TwoFactorSendPushRequest()
-
-        rq.encryptedLoginToken = encryptedLoginToken
-        if channel_uid:
-            rq.channel_uid = channel_uid
-
-        if expireIn:
-            rq.expireIn = expireIn
+        rq = _reusable_request(proto.TwoFactorSendPushRequest)
+        try:
+            rq.encryptedLoginToken = encryptedLoginToken
+            if channel_uid:
+                rq.channel_uid = channel_uid
 
-        if pushType:
-            rq.pushType = pushType
+            if expireIn:
+                rq.expireIn = expireIn
 
-        api_request_payload = proto.ApiRequestPayload()
-        api_request_payload.payload = rq.SerializeToString()
+            if pushType:
+                rq.pushType = pushType
 
-        return rest_api.execute_rest(params.rest_context, 'authentication/2fa_send_push', api_request_payload)
+            return LoginV3API.rest_request(params, 'authentication/2fa_send_push', rq)
+        finally:
+            rq.Clear()
 
     @staticmethod
     def rename_device(params: KeeperParams, new_name):
 
         rq = proto.DeviceUpdateRequest()
-        rq.clientVersion = rest_api.CLIENT_VERSION
+        rq.clientVersion = CLIENT_VERSION
         # rq.deviceStatus = proto.DEVICE_OK
         rq.deviceName = new_name
         rq.encryptedDeviceToken = LoginV3API.get_device_id(params)
@@ -1102,7 +1162,7 @@ class LoginV3API:
 
     @staticmethod
     def register_encrypted_data_key_for_device(params: KeeperParams):
-        device_key = crypto.load_ec_private_key(utils.base64_url_decode(params.device_private_key))
+        device_key = LoginV3API.get_device_private_key(params)
         rq = proto.RegisterDeviceDataKeyRequest()
         rq.encryptedDeviceToken = utils.base64_url_decode(params.device_token)
         rq.encryptedDeviceDataKey = crypto.encrypt_ec(params.data_key, device_key.public_key())
@@ -1119,13 +1179,11 @@ class LoginV3API:
     def register_device_in_region(params, encrypted_device_token):  # type: (KeeperParams, bytes) -> None
         rq = proto.RegisterDeviceInRegionRequest()
         rq.encryptedDeviceToken = encrypted_device_token
-        rq.clientVersion = rest_api.CLIENT_VERSION
+        rq.clientVersion = CLIENT_VERSION
         rq.deviceName = CommonHelperMethods.get_device_name()
-        device_key = crypto.load_ec_private_key(utils.base64_url_decode(params.device_private_key))
+        device_key = LoginV3API.get_device_private_key(params)
         rq.devicePublicKey = crypto.unload_ec_public_key(device_key.public_key())
-        api_request_payload = proto.ApiRequestPayload()
-        api_request_payload.payload = rq.SerializeToString()
-        rs = rest_api.execute_rest(params.rest_context, 'authentication/register_device_in_region', api_request_payload)
+        rs = LoginV3API.rest_request(params, 'authentication/register_device_in_region', rq)
         if isinstance(rs, dict):
             if 'error' in rs and rs['error'] == 'exists':
                 return
@@ -1164,24 +1222,18 @@ class LoginV3API:
         rq = LoginToMcRequest()
         rq.mcEnterpriseId = mc_id
 
-        api_request_payload = proto.ApiRequestPayload()
-        # api_request_payload.payload = rq.SerializeToString()
-
-        api_request_payload.encryptedSessionToken = base64.urlsafe_b64decode(session_token + '==')
-        api_request_payload.payload = rq.SerializeToString()
-
         try:
-            rs = rest_api.execute_rest(rest_context, endpoint, api_request_payload)
+            rs = LoginV3API._send(rest_context, endpoint, rq, utils.base64_url_decode(session_token))
         except Exception as e:
             raise KeeperApiError('Rest API', str(e))
 
-        if type(rs) == bytes:
+        if isinstance(rs, bytes):
 
             login_to_mc_rs = LoginToMcResponse()
             login_to_mc_rs.ParseFromString(rs)
 
             return login_to_mc_rs
-        elif type(rs) == dict:
+        elif isinstance(rs, dict):
             raise KeeperApiError(rs['error'], rs['message'])
         raise KeeperApiError('Error', endpoint)
 
@@ -1194,8 +1246,7 @@ class CommonHelperMethods:
 
     @staticmethod
     def url_safe_str_to_bytes(s):
-        b = base64.urlsafe_b64decode(s + '==')
-        return b
+        return utils.base64_url_decode(s)
 
     @staticmethod
     def url_safe_str_to_int(s):
@@ -1204,7 +1255,7 @@ class CommonHelperMethods:
 
     @staticmethod
     def bytes_to_url_safe_str(b):
-        return base64.urlsafe_b64encode(b).decode().rstrip('=')
+        return utils.base64_url_encode(b)
 
     @staticmethod
     def get_os():
@@ -1226,11 +1277,8 @@ class CommonHelperMethods:
     @staticmethod
     def check_int(s):
         # check if string is an integer
-        num_str = str(s)
-
-        if num_str[0] in ('-', '+'):
-            return num_str[1:].isdigit()
-        return num_str.isdigit()
+        num_str = s if isinstance(s, str) else str(s)
+        return (num_str[1:] if num_str[:1] in ('-', '+') else num_str).isdigit()
 
     @staticmethod
     def fill_password_with_prompt_if_missing(params: KeeperParams):
@@ -8,13 +8,19 @@
 # Contact: ops@keepersecurity.com
 #
 
+import threading
 import warnings
 from datetime import datetime
+from http.cookiejar import DefaultCookiePolicy
 from typing import Dict, NamedTuple, Optional
 from urllib.parse import urlparse, urlunparse
 
+import requests
+from requests.adapters import HTTPAdapter
 from urllib3.exceptions import InsecureRequestWarning
 
+from . import utils
+
 LAST_RECORD_UID = 'last_record_uid'
 LAST_SHARED_FOLDER_UID = 'last_shared_folder_uid'
 LAST_FOLDER_UID = 'last_folder_uid'
@@ -37,6 +43,20 @@ class RestApiContext:
         self.proxies = None
         self._certificate_check = True
         self.fail_on_throttle = False
+        self.__session = None
+        self.__session_lock = threading.Lock()
+
+    @property
+    def session(self):    # type: () -> requests.Session
+        if self.__session is None:
+            with self.__session_lock:
+                if self.__session is None:
+                    session = requests.Session()
+                    # Keeper REST calls are stateless: do not keep server cookies between requests
+                    session.cookies.set_policy(DefaultCookiePolicy(allowed_domains=[]))
+                    session.mount('https://', HTTPAdapter(pool_connections=4, pool_maxsize=8))
+                    self.__session = session
+        return self.__session
 
     def __get_server_base(self):
         return self.__server_base
@@ -141,9 +161,11 @@ class KeeperParams:
         self.record_history = {}        # type: dict[str, (list[dict], int)]
         self.event_queue = []
         self.logout_timer = 0
-        self.clone_code = None
+        self.__clone_code = None
+        self.__clone_code_bytes = None
         self.device_token = None
         self.device_private_key = None
+        self.device_private_key_cache = None    # type: Optional[tuple]
         self.account_uid_bytes = None
         self.session_token_bytes = None
         self.record_type_cache = {}  # RT definitions only
@@ -222,6 +244,25 @@ class KeeperParams:
         self.__server = value
         self.__rest_context.server_base = value
 
+    # Only the form that was last assigned is stored; the other one is converted on first read
+    def __get_clone_code(self):    # type: () -> Optional[str]
+        if self.__clone_code is None and self.__clone_code_bytes is not None:
+            self.__clone_code = utils.base64_url_encode(self.__clone_code_bytes)
+        return self.__clone_code
+
+    def __set_clone_code(self, value):    # type: (Optional[str]) -> None
+        self.__clone_code = value
+        self.__clone_code_bytes = None
+
+    def __get_clone_code_bytes(self):    # type: () -> Optional[bytes]
+        if self.__clone_code_bytes is None and self.__clone_code:
+            self.__clone_code_bytes = utils.base64_url_decode(self.__clone_code)
+        return self.__clone_code_bytes
+
+    def __set_clone_code_bytes(self, value):    # type: (Optional[bytes]) -> None
+        self.__clone_code_bytes = value
+        self.__clone_code = None
+
     def __get_proxy(self):
         return self.__proxy
 
@@ -241,6 +282,8 @@ class KeeperParams:
     proxy = property(__get_proxy, __set_proxy)
     server = property(__get_server, __set_server)
     rest_context = property(__get_rest_context)
+    clone_code = property(__get_clone_code, __set_clone_code)
+    clone_code_bytes = property(__get_clone_code_bytes, __set_clone_code_bytes)
 
     def get_share_account_timestamp(self):
         if self.settings and 'share_account_to' in self.settings and 'must_perform_account_share_by' in self.settings:
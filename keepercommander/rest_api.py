@@ -146,8 +146,8 @@ def execute_rest(context, endpoint, payload):
             url = context.server_base + endpoint
 
         try:
-            rs = requests.post(url, data=request_data, headers={'Content-Type': 'application/octet-stream'},
-                               proxies=context.proxies, verify=context.certificate_check)
+            rs = context.session.post(url, data=request_data, headers={'Content-Type': 'application/octet-stream'},
+                                      proxies=context.proxies, verify=context.certificate_check)
         except requests.exceptions.SSLError as e:
             doc_url = 'https://docs.keeper.io/secrets-manager/commander-cli/using-commander/troubleshooting-commander-cli#ssl-certificate-errors'
             if len(e.args) > 0:
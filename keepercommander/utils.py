@@ -19,6 +19,11 @@ from urllib.parse import urlparse
 from . import crypto
 from .constants import EMAIL_PATTERN
 
+try:
+    from pybase64 import urlsafe_b64decode, urlsafe_b64encode
+except ImportError:
+    from base64 import urlsafe_b64decode, urlsafe_b64encode
+
 
 VALID_URL_SCHEME_CHARS = '+-.:'
 
@@ -36,11 +41,11 @@ def current_milli_time():       # type: () -> int
 
 
 def base64_url_decode(s):       # type: (str) -> bytes
-    return base64.urlsafe_b64decode(s + '==')
+    return urlsafe_b64decode(s + '==')
 
 
 def base64_url_encode(b):       # type: (bytes) -> str
-    bs = base64.urlsafe_b64encode(b)
+    bs = urlsafe_b64encode(b)
     return bs.rstrip(b'=').decode('ascii')
 
 
@@ -0,0 +1,307 @@
+import re
+import time
+from unittest import TestCase, mock
+from urllib.parse import parse_qsl, urlparse
+
+from keepercommander import crypto, loginv3, utils
+from keepercommander.error import KeeperApiError
+from keepercommander.loginv3 import LoginV3API, LoginV3Flow
+from keepercommander.params import KeeperParams
+from keepercommander.proto import APIRequest_pb2 as proto
+from keepercommander.proto import ssocloud_pb2 as ssocloud
+from keepercommander.proto.enterprise_pb2 import DomainPasswordRulesRequest
+
+
+class TestLoginV3API(TestCase):
+    def setUp(self):
+        self.requests = []
+        self.send_mock = mock.patch('keepercommander.loginv3.LoginV3API._send').start()
+        self.send_mock.side_effect = self.send_request
+
+    def tearDown(self):
+        mock.patch.stopall()
+
+    def send_request(self, rest_context, api_endpoint, rq, encrypted_session_token=None):
+        self.requests.append((api_endpoint, rq.SerializeToString()))
+        return b''
+
+    def test_two_factor_validate_clears_request(self):
+        params = KeeperParams()
+        LoginV3API.twoFactorValidateMessage(params, b'login_token', '123456', proto.TWO_FA_EXP_NEVER,
+                                            proto.TWO_FA_CODE_TOTP, channel_uid=b'channel')
+        LoginV3API.twoFactorValidateMessage(params, b'login_token', '654321', proto.TWO_FA_EXP_IMMEDIATELY)
+
+        rqs = []
+        for endpoint, data in self.requests:
+            self.assertEqual(endpoint, 'authentication/2fa_validate')
+            rq = proto.TwoFactorValidateRequest()
+            rq.ParseFromString(data)
+            rqs.append(rq)
+        self.assertEqual(rqs[0].value, '123456')
+        self.assertEqual(rqs[0].channel_uid, b'channel')
+        self.assertEqual(rqs[0].expireIn, proto.TWO_FA_EXP_NEVER)
+        self.assertEqual(rqs[1].value, '654321')
+        self.assertEqual(rqs[1].channel_uid, b'')
+        self.assertEqual(rqs[1].valueType, 0)
+
+        cached = loginv3._reusable_request(proto.TwoFactorValidateRequest)
+        self.assertEqual(cached.ByteSize(), 0)
+
+    def test_two_factor_push_clears_request(self):
+        params = KeeperParams()
+        LoginV3API.twoFactorSend2FAPushMessage(params, b'login_token', pushType=proto.TWO_FA_PUSH_SMS,
+                                               channel_uid=b'channel')
+        self.send_mock.side_effect = Exception('connection error')
+        with self.assertRaises(Exception):
+            LoginV3API.twoFactorSend2FAPushMessage(params, b'login_token', pushType=proto.TWO_FA_PUSH_SMS)
+
+        endpoint, data = self.requests[0]
+        self.assertEqual(endpoint, 'authentication/2fa_send_push')
+        rq = proto.TwoFactorSendPushRequest()
+        rq.ParseFromString(data)
+        self.assertEqual(rq.encryptedLoginToken, b'login_token')
+        self.assertEqual(rq.pushType, proto.TWO_FA_PUSH_SMS)
+
+        cached = loginv3._reusable_request(proto.TwoFactorSendPushRequest)
+        self.assertEqual(cached.ByteSize(), 0)
+
+    def test_device_private_key_cache(self):
+        params = KeeperParams()
+        private_key, _ = crypto.generate_ec_key()
+        params.device_private_key = utils.base64_url_encode(crypto.unload_ec_private_key(private_key))
+        device_key = LoginV3API.get_device_private_key(params)
+        self.assertEqual(crypto.unload_ec_private_key(device_key), crypto.unload_ec_private_key(private_key))
+        self.assertIs(LoginV3API.get_device_private_key(params), device_key)
+
+        other_key, _ = crypto.generate_ec_key()
+        params.device_private_key = utils.base64_url_encode(crypto.unload_ec_private_key(other_key))
+        reloaded_key = LoginV3API.get_device_private_key(params)
+        self.assertIsNot(reloaded_key, device_key)
+        self.assertEqual(crypto.unload_ec_private_key(reloaded_key), crypto.unload_ec_private_key(other_key))
+
+        with mock.patch('keepercommander.loginv3.loader.store_config_properties'):
+            LoginV3API.get_device_id(params, new_device=True)
+        self.assertEqual(self.requests[0][0], 'authentication/register_device')
+        self.assertIsNone(params.device_private_key_cache)
+        new_key = LoginV3API.get_device_private_key(params)
+        self.assertNotEqual(crypto.unload_ec_private_key(new_key), crypto.unload_ec_private_key(other_key))
+
+
+class TestPostLoginProcessing(TestCase):
+    def setUp(self):
+        self.enterprise_key_requested = False
+        self.enterprise_key_completed = False
+        self.account_type = 2
+        self.stored_clone_codes = []
+        self.summary_mock = mock.patch('keepercommander.loginv3.LoginV3API.accountSummary').start()
+        mock.patch('keepercommander.loginv3.LoginV3Flow.get_data_key', return_value='Password').start()
+        mock.patch('keepercommander.loginv3.LoginV3Flow.populateAccountSummary',
+                   side_effect=self.populate_account_summary).start()
+        mock.patch('keepercommander.loginv3.loader.store_config_properties',
+                   side_effect=lambda params: self.stored_clone_codes.append(params.clone_code)).start()
+        mock.patch('keepercommander.api.communicate_rest', side_effect=self.communicate_rest).start()
+
+    def tearDown(self):
+        mock.patch.stopall()
+
+    def populate_account_summary(self, params, acct_summary=None):
+        params.license = {'account_type': self.account_type}
+
+    def communicate_rest(self, params, request, endpoint, rs_type=None):
+        self.assertEqual(endpoint, 'enterprise/get_enterprise_public_key')
+        self.enterprise_key_requested = True
+        time.sleep(0.1)
+        self.enterprise_key_completed = True
+        return rs_type()
+
+    @staticmethod
+    def get_login_response(session_token_type):
+        resp = proto.LoginResponse()
+        resp.primaryUsername = 'user@company.com'
+        resp.encryptedSessionToken = b'session_token'
+        resp.sessionTokenType = session_token_type
+        resp.cloneCode = b'\x01\x02'
+        return resp
+
+    def test_enterprise_key_completes_before_return(self):
+        # A non-enterprise account never reads the enterprise key, yet the request must not outlive the login
+        self.account_type = 1
+        params = KeeperParams()
+        self.assertTrue(LoginV3Flow.post_login_processing(params, self.get_login_response(proto.NO_RESTRICTION)))
+        self.assertTrue(self.enterprise_key_requested)
+        self.assertTrue(self.enterprise_key_completed)
+        self.assertEqual(params.session_token, 'c2Vzc2lvbl90b2tlbg')
+
+    def test_account_summary_failure_clears_password(self):
+        self.summary_mock.side_effect = KeeperApiError('session_token_expired', 'Session expired')
+        params = KeeperParams()
+        params.password = 'secret'
+        params.clone_code = 'old_clone_code'
+        with self.assertRaises(KeeperApiError):
+            LoginV3Flow.post_login_processing(params, self.get_login_response(proto.RESTRICT))
+        self.assertIsNone(params.password)
+        self.assertEqual(params.clone_code, 'AQI')
+        self.assertEqual(self.stored_clone_codes, ['AQI'])
+
+    def test_account_summary_failure_with_enterprise_key_request(self):
+        self.summary_mock.side_effect = KeeperApiError('session_token_expired', 'Session expired')
+        params = KeeperParams()
+        params.password = 'secret'
+        with self.assertRaises(KeeperApiError):
+            LoginV3Flow.post_login_processing(params, self.get_login_response(proto.NO_RESTRICTION))
+        self.assertTrue(self.enterprise_key_completed)
+        self.assertIsNone(params.password)
+        self.assertEqual(self.stored_clone_codes, ['AQI'])
+
+    def test_restricted_session_skips_enterprise_key(self):
+        params = KeeperParams()
+        with self.assertRaises(Exception):
+            LoginV3Flow.post_login_processing(params, self.get_login_response(proto.RESTRICT))
+        self.assertFalse(self.enterprise_key_requested)
+        self.assertIsNone(params.session_token)
+
+
+class TestChangeMasterPassword(TestCase):
+    def tearDown(self):
+        mock.patch.stopall()
+
+    @staticmethod
+    def change_master_password(rules, passwords, descriptions=None):
+        rules_rs = proto.NewUserMinimumParams()
+        for rule, description in rules:
+            rules_rs.passwordMatchRegex.append(rule)
+            rules_rs.passwordMatchDescription.append(description)
+        if descriptions is not None:
+            del rules_rs.passwordMatchDescription[:]
+            rules_rs.passwordMatchDescription.extend(descriptions)
+
+        def communicate_rest(params, request, endpoint, rs_type=None):
+            assert isinstance(request, DomainPasswordRulesRequest)
+            return rules_rs
+
+        # Each password is entered twice: once and once more to confirm it
+        inputs = [x for password in passwords for x in (password, password)] + ['']
+        mock.patch('keepercommander.api.communicate_rest', side_effect=communicate_rest).start()
+        mock.patch('getpass.getpass', side_effect=inputs).start()
+        mock.patch('builtins.print').start()
+        change_mock = mock.patch('keepercommander.loginv3.LoginV3API.change_master_password').start()
+        result = LoginV3Flow.change_master_password(KeeperParams())
+        return result, [x[0][1] for x in change_mock.call_args_list]
+
+    def test_combined_rules(self):
+        patterns = [r'.{8,}', r'.*[A-Z]', r'.*\d']
+        all_rules = LoginV3Flow.combine_password_rules([re.compile(x) for x in patterns])
+        self.assertIsNotNone(all_rules)
+        for password in ('Password1', 'password1', 'Pass1', 'Password'):
+            self.assertEqual(bool(all_rules.match(password)), all(re.match(x, password) for x in patterns))
+
+        result, changed = self.change_master_password(
+            [(x, x) for x in patterns], ['short1A', 'nodigitsHERE', 'Password1'])
+        self.assertTrue(result)
+        self.assertEqual(changed, ['Password1'])
+
+    def test_group_reference_rules_are_not_combined(self):
+        # Group numbers shift when rules are concatenated: (?(1)...) in the second rule would refer to the first
+        rules = [(r'(\d)?.*', 'digit group'), (r'(a)?(?(1)b|c)', 'a must be followed by b')]
+        self.assertIsNone(LoginV3Flow.combine_password_rules([re.compile(x) for x, _ in rules]))
+        self.assertIsNone(LoginV3Flow.combine_password_rules([re.compile(r'(.)\1')]))
+        self.assertIsNone(LoginV3Flow.combine_password_rules([re.compile(r'(?P<x>.)(?P=x)')]))
+        self.assertIsNone(LoginV3Flow.combine_password_rules([re.compile(r'(?i)password')]))
+
+        result, changed = self.change_master_password(rules, ['ac', 'ab'])
+        self.assertTrue(result)
+        self.assertEqual(changed, ['ab'])
+
+    def test_rules_that_do_not_compile_together(self):
+        # Both rules are valid alone but define the same group name
+        rules = [(r'(?P<first>.).{7,}', 'at least 8 characters'), (r'(?P<first>[A-Z])', 'starts with a capital')]
+        self.assertIsNone(LoginV3Flow.combine_password_rules([re.compile(x) for x, _ in rules]))
+
+        result, changed = self.change_master_password(rules, ['password', 'Password'])
+        self.assertTrue(result)
+        self.assertEqual(changed, ['Password'])
+
+    def test_rule_without_description(self):
+        rules = [(r'.{8,}', ''), (r'.*\d', '')]
+        with self.assertLogs(level='WARNING') as logs:
+            result, changed = self.change_master_password(rules, ['NoDigitsHere', 'HasDigits1'],
+                                                          descriptions=['at least 8 characters'])
+        self.assertTrue(result)
+        self.assertEqual(changed, ['HasDigits1'])
+        self.assertTrue(any(r'.*\d' in x for x in logs.output))
+
+    def test_fast_path_checks_the_same_rules(self):
+        # The combined pattern is built from the same rule list that the per-rule check reports on
+        rules = [(r'.{8,}', ''), (r'.*\d', ''), (r'.*[A-Z]', '')]
+        with mock.patch('keepercommander.loginv3.LoginV3Flow.combine_password_rules',
+                        wraps=LoginV3Flow.combine_password_rules) as combine_mock:
+            result, changed = self.change_master_password(
+                rules, ['nodigitshere', 'NoDigitsHere', 'HasDigits1'], descriptions=['at least 8 characters'])
+        self.assertTrue(result)
+        self.assertEqual(changed, ['HasDigits1'])
+        self.assertEqual([x.pattern for x in combine_mock.call_args[0][0]], [x for x, _ in rules])
+
+    def test_no_rules(self):
+        self.assertIsNone(LoginV3Flow.combine_password_rules([]))
+        result, changed = self.change_master_password([], [])
+        self.assertFalse(result)
+        self.assertEqual(changed, [])
+
+
+class TestSsoRedirect(TestCase):
+    def tearDown(self):
+        mock.patch.stopall()
+
+    def test_sso_login_url(self):
+        self.assertEqual(LoginV3Flow.sso_login_url('https://sso.company.com/login', 'payload=AQID_v8'),
+                         'https://sso.company.com/login?payload=AQID_v8')
+        # The existing query is kept verbatim
+        self.assertEqual(LoginV3Flow.sso_login_url('https://sso.company.com/login?a=1&b=x%20y', 'payload=AQID_v8'),
+                         'https://sso.company.com/login?a=1&b=x%20y&payload=AQID_v8')
+        self.assertEqual(LoginV3Flow.sso_login_url('https://sso.company.com/login?a=1#section', 'payload=AQID_v8'),
+                         'https://sso.company.com/login?a=1&payload=AQID_v8#section')
+        self.assertEqual(LoginV3Flow.sso_login_url('https://sso.company.com/login#section', 'payload=AQID_v8'),
+                         'https://sso.company.com/login?payload=AQID_v8#section')
+
+    def get_sso_url(self, is_cloud, sso_url):
+        print_mock = mock.patch('builtins.print').start()
+        mock.patch('builtins.input', return_value='q').start()
+        mock.patch('webbrowser.get', side_effect=Exception()).start()
+        params = KeeperParams()
+        params.user = 'User@Company.com'
+        with self.assertRaises(KeyboardInterrupt):
+            LoginV3Flow.handleSsoRedirect(params, is_cloud, sso_url, b'login_token')
+        line = next(x[0][0] for x in print_mock.call_args_list if x[0] and 'SSO Login URL:' in str(x[0][0]))
+        return line.split('\n')[-1]
+
+    def test_onsite_sso_url(self):
+        private_key, public_key = crypto.generate_rsa_key()
+        mock.patch('keepercommander.crypto.generate_rsa_key', return_value=(private_key, public_key)).start()
+        sp_url = self.get_sso_url(False, 'https://sso.company.com/sso/login?team=1#top')
+
+        url = urlparse(sp_url)
+        self.assertEqual(url.path, '/sso/login')
+        self.assertEqual(url.fragment, 'top')
+        key = utils.base64_url_encode(crypto.unload_rsa_public_key(public_key))
+        self.assertEqual(url.query, f'team=1&key={key}&dest=commander&embedded=')
+        self.assertEqual(parse_qsl(url.query, keep_blank_values=True),
+                         [('team', '1'), ('key', key), ('dest', 'commander'), ('embedded', '')])
+
+    def test_cloud_sso_url(self):
+        transmission_key = utils.generate_aes_key()
+        mock.patch('keepercommander.utils.generate_aes_key', return_value=transmission_key).start()
+        sp_url = self.get_sso_url(True, 'https://keepersecurity.com/api/rest/sso/saml/login/1234')
+
+        url = urlparse(sp_url)
+        query = parse_qsl(url.query, keep_blank_values=True)
+        self.assertEqual([x for x, _ in query], ['payload'])
+
+        api_rq = proto.ApiRequest()
+        api_rq.ParseFromString(utils.base64_url_decode(query[0][1]))
+        rq_payload = proto.ApiRequestPayload()
+        rq_payload.ParseFromString(crypto.decrypt_aes_v2(api_rq.encryptedPayload, transmission_key))
+        sso_rq = ssocloud.SsoCloudRequest()
+        sso_rq.ParseFromString(rq_payload.payload)
+        self.assertEqual(sso_rq.username, 'user@company.com')
+        self.assertEqual(sso_rq.dest, 'commander')
+        self.assertTrue(sso_rq.detached)
@@ -0,0 +1,46 @@
+from unittest import TestCase
+
+from keepercommander import utils
+from keepercommander.params import KeeperParams
+
+
+class TestKeeperParams(TestCase):
+    def test_clone_code_updates_bytes(self):
+        params = KeeperParams()
+        self.assertIsNone(params.clone_code)
+        self.assertIsNone(params.clone_code_bytes)
+
+        clone_code = utils.base64_url_encode(b'\x01\x02\x03\xfe\xff')
+        params.clone_code = clone_code
+        self.assertEqual(params.clone_code, clone_code)
+        self.assertEqual(params.clone_code_bytes, b'\x01\x02\x03\xfe\xff')
+
+        params.clone_code = ''
+        self.assertEqual(params.clone_code, '')
+        self.assertIsNone(params.clone_code_bytes)
+
+        params.clone_code = None
+        self.assertIsNone(params.clone_code)
+        self.assertIsNone(params.clone_code_bytes)
+
+    def test_clone_code_bytes_updates_clone_code(self):
+        params = KeeperParams()
+        params.clone_code_bytes = b'\x01\x02\x03\xfe\xff'
+        self.assertEqual(params.clone_code, 'AQID_v8')
+        self.assertEqual(params.clone_code_bytes, b'\x01\x02\x03\xfe\xff')
+
+        # An empty clone code from the login response is stored as an empty string, not dropped
+        params.clone_code_bytes = b''
+        self.assertEqual(params.clone_code, '')
+        self.assertEqual(params.clone_code_bytes, b'')
+
+        params.clone_code_bytes = None
+        self.assertIsNone(params.clone_code)
+        self.assertIsNone(params.clone_code_bytes)
+
+    def test_malformed_clone_code_fails_on_use(self):
+        params = KeeperParams()
+        params.clone_code = 'A'
+        self.assertEqual(params.clone_code, 'A')
+        with self.assertRaises(ValueError):
+            _ = params.clone_code_bytes
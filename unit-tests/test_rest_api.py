@@ -0,0 +1,42 @@
+from http.client import HTTPMessage
+from unittest import TestCase, mock
+
+import requests
+from requests.cookies import MockRequest, MockResponse
+
+from keepercommander import crypto, rest_api, utils
+from keepercommander.params import RestApiContext
+from keepercommander.proto import APIRequest_pb2 as proto
+
+
+class TestExecuteRest(TestCase):
+    def test_execute_rest_uses_context_session(self):
+        context = RestApiContext(server='keepersecurity.com')
+        context.transmission_key = utils.generate_aes_key()
+
+        rs = mock.Mock()
+        rs.status_code = 200
+        rs.headers = {'Content-Type': 'application/octet-stream'}
+        rs.content = crypto.encrypt_aes_v2(b'response', context.transmission_key)
+
+        with mock.patch.object(context.session, 'post', return_value=rs) as mock_post, \
+                mock.patch('requests.post') as mock_requests_post:
+            result = rest_api.execute_rest(context, 'authentication/start_login', proto.ApiRequestPayload())
+
+        self.assertEqual(result, b'response')
+        mock_requests_post.assert_not_called()
+        mock_post.assert_called_once()
+        args, kwargs = mock_post.call_args
+        self.assertEqual(args[0], 'https://keepersecurity.com/api/rest/authentication/start_login')
+        self.assertIs(kwargs['verify'], context.certificate_check)
+
+    def test_session_is_shared_and_keeps_no_cookies(self):
+        context = RestApiContext()
+        session = context.session
+        self.assertIs(context.session, session)
+
+        headers = HTTPMessage()
+        headers['Set-Cookie'] = 'session=value; Path=/'
+        rq = requests.Request('POST', context.server_base + 'authentication/start_login').prepare()
+        session.cookies.extract_cookies(MockResponse(headers), MockRequest(rq))
+        self.assertEqual(len(session.cookies), 0)